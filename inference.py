@@ -6,68 +6,96 @@ Pipeline principal :
 3. Classification par mots-clés médicaux
 4. Génération des résumés
 5. Sauvegarde en base de données SQLite
+
+Avec --pdf-dir, tous les PDFs d'un dossier sont traités en parallèle.
 """
 from __future__ import annotations
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import json
+import logging
+import os
 from pathlib import Path
+from queue import Empty, Queue
+import threading
+from typing import Any
 
 from src.extract_text import extract_text_from_pdf
 from src.sections import extract_abstract_and_conclusion
-from src.llm_extract import llm_extract_abstract_conclusion
+from src.llm_extract import (
+    llm_extract_abstract,
+    llm_extract_abstract_conclusion,
+    llm_extract_conclusion,
+)
 from src.keywords import classify_by_keywords
-from src.summarize import summarize, clean_extracted_text
-from src.db import get_conn, insert_paper
+from src.summarize import summarize, clean_extracted_text, warmup
+from src.db import dedupe_papers, get_conn, get_paper, insert_paper, insert_papers, transaction
+
+
+logger = logging.getLogger(__name__)
+
+# Chaque processus du mode batch charge ses propres modèles : on borne leur nombre
+MAX_BATCH_WORKERS = 4
 
 
-def _extract_sections(text: str) -> tuple[str, str]:
+def _extract_sections(text: str, cache_db: str | Path | None = None) -> tuple[str, str]:
     """Extrait abstract et conclusion avec fallback LLM si nécessaire."""
     abstract, conclusion = extract_abstract_and_conclusion(text)
-    
-    if (not abstract or len(abstract.split()) < 50) or \
-       (not conclusion or len(conclusion.split()) < 30):
-        abs_llm, conc_llm = llm_extract_abstract_conclusion(text)
-        if not abstract or len(abstract.split()) < 50:
-            abstract = abs_llm or abstract
-        if not conclusion or len(conclusion.split()) < 30:
-            conclusion = conc_llm or conclusion
+    need_abstract = not abstract or len(abstract.split()) < 50
+    need_conclusion = not conclusion or len(conclusion.split()) < 30
+
+    # Le LLM n'est appelé que pour la ou les sections manquantes
+    if need_abstract and need_conclusion:
+        abs_llm, conc_llm = llm_extract_abstract_conclusion(text, cache_db=cache_db)
+        abstract = abs_llm or abstract
+        conclusion = conc_llm or conclusion
+    elif need_abstract:
+        abstract = llm_extract_abstract(text, cache_db=cache_db) or abstract
+    elif need_conclusion:
+        conclusion = llm_extract_conclusion(text, cache_db=cache_db) or conclusion
     
     return abstract, conclusion
 
 
 def _get_text_tail(text: str, max_words: int = 200) -> str:
     """Extrait la fin du texte (utilisée comme fallback)."""
-    parts = [p.strip() for p in text.replace("\r", "\n").split("\n\n") if p.strip()]
-    words = []
-    for p in reversed(parts):
-        words.extend(p.split())
-        if len(words) >= max_words:
-            break
-    return " ".join(reversed(words[-max_words:])).strip()
+    # ~10 caractères par mot suffisent : inutile de découper tout le document
+    tail = text[-max_words * 10:]
+    words = tail.split()
+    if len(tail) < len(text) and not tail[:1].isspace():
+        words = words[1:]  # premier mot potentiellement coupé
+    return " ".join(words[-max_words:])
+
 
+def _generate_conclusion_summary(
+    conclusion_clean: str, conclusion_raw: str, raw_text: str, raw_text_clean: str
+) -> str:
+    """Génère un résumé de conclusion avec fallback sur contenu général.
 
-def _generate_conclusion_summary(conclusion_clean: str, conclusion_raw: str, raw_text: str) -> str:
-    """Génère un résumé de conclusion avec fallback sur contenu général."""
+    `raw_text_clean` est le texte complet déjà nettoyé par l'appelant.
+    """
     summary = summarize(conclusion_clean or conclusion_raw) if (conclusion_clean or conclusion_raw) else ""
     
     if not summary:
-        fallback = _get_text_tail(raw_text, 200) or clean_extracted_text(raw_text) or raw_text
+        fallback = _get_text_tail(raw_text, 200) or raw_text_clean or raw_text
         summary = summarize(fallback)
     
     return summary or "Conclusion non disponible."
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Analyse PDF scientifique")
-    parser.add_argument("--pdf", required=True, help="Chemin vers le PDF")
-    parser.add_argument("--db", default="db/papers.sqlite", help="Chemin vers la BD SQLite")
-    args = parser.parse_args()
-
-    pdf_path = Path(args.pdf)
-    raw_text = extract_text_from_pdf(pdf_path)
+def process_one_pdf(
+    pdf_path: str | Path,
+    cache_db: str | Path | None = None,
+    workers: int | None = None,
+) -> dict[str, Any]:
+    """Analyse un PDF et retourne la ligne à insérer dans la table papers."""
+    # Chemin absolu : clé unique du PDF en BD, quel que soit le répertoire courant
+    pdf_path = Path(pdf_path).resolve()
+    raw_text = extract_text_from_pdf(pdf_path, workers=workers)
 
     # Extraction et nettoyage des sections
-    abstract_raw, conclusion_raw = _extract_sections(raw_text)
+    abstract_raw, conclusion_raw = _extract_sections(raw_text, cache_db=cache_db)
     abstract_clean = clean_extracted_text(abstract_raw)
     conclusion_clean = clean_extracted_text(conclusion_raw)
     raw_text_clean = clean_extracted_text(raw_text)
@@ -77,22 +105,11 @@ def main():
 
     # Génération des résumés
     abstract_summary = summarize(abstract_clean or abstract_raw) if (abstract_clean or abstract_raw) else ""
-    conclusion_summary = _generate_conclusion_summary(conclusion_clean, conclusion_raw, raw_text)
+    conclusion_summary = _generate_conclusion_summary(
+        conclusion_clean, conclusion_raw, raw_text, raw_text_clean
+    )
 
-    # Résultat JSON
-    result = {
-        "pdf": str(pdf_path),
-        "region": classification.region,
-        "region_score": classification.region_score,
-        "fracture_types": classification.fracture_types,
-        "locations": classification.locations,
-        "abstract_summary": abstract_summary,
-        "conclusion_summary": conclusion_summary,
-    }
-
-    # Sauvegarde en BD
-    conn = get_conn(args.db)
-    paper_id = insert_paper(conn, {
+    return {
         "filename": pdf_path.name,
         "pdf_path": str(pdf_path),
         "raw_text": raw_text_clean,
@@ -104,10 +121,202 @@ def main():
         "locations": ",".join(classification.locations),
         "abstract_summary": abstract_summary,
         "conclusion_summary": conclusion_summary,
-    })
-    result["db_id"] = paper_id
+    }
+
+
+def _process_safe(
+    pdf_path: Path, cache_db: str | Path | None = None
+) -> tuple[Path, dict[str, Any] | None, str | None]:
+    """Analyse un PDF dans un processus du pool : (chemin, ligne, erreur).
+
+    L'erreur est renvoyée sous forme de message pour qu'un PDF invalide
+    n'interrompe pas le traitement des autres.
+    """
+    try:
+        return pdf_path, process_one_pdf(pdf_path, cache_db=cache_db, workers=1), None
+    except Exception as exc:
+        return pdf_path, None, f"{type(exc).__name__}: {exc}"
+
+
+def _init_worker(n_threads: int) -> None:
+    """Initialise un processus du pool : threads torch bornés et modèle chargé.
+
+    Une erreur de préchargement n'arrête pas le pool : le modèle sera chargé
+    au premier résumé et l'erreur rapportée pour chaque PDF par `_process_safe`.
+    """
+    try:
+        import torch
+    except ImportError:
+        pass
+    else:
+        torch.set_num_threads(n_threads)
+    try:
+        warmup()
+    except Exception as exc:
+        logger.warning("Préchargement du modèle de résumé impossible : %s", exc)
+
+
+def _result_from_row(row: dict[str, Any], paper_id: int) -> dict[str, Any]:
+    """Construit le résultat JSON à partir d'une ligne de la table papers."""
+    return {
+        "pdf": row["pdf_path"],
+        "region": row["region"],
+        "region_score": row["region_score"],
+        "fracture_types": row["fracture_types"].split(",") if row["fracture_types"] else [],
+        "locations": row["locations"].split(",") if row["locations"] else [],
+        "abstract_summary": row["abstract_summary"],
+        "conclusion_summary": row["conclusion_summary"],
+        "db_id": paper_id,
+    }
+
+
+def _drain(q: Queue, n: int, timeout: float) -> list:
+    """Récupère jusqu'à n éléments de la file (attend le premier au plus `timeout` s)."""
+    try:
+        items = [q.get(timeout=timeout)]
+    except Empty:
+        return []
+    while len(items) < n:
+        try:
+            items.append(q.get_nowait())
+        except Empty:
+            break
+    return items
+
+
+def _writer(
+    db_path: str | Path,
+    q: Queue,
+    results: list[dict[str, Any]],
+    errors: list[BaseException],
+    replace: bool = False,
+) -> None:
+    """Thread écrivain unique : insère les lignes de la file par lots.
+
+    Une erreur d'écriture est ajoutée à `errors` (un thread ne la propage pas).
+    """
+    try:
+        conn = get_conn(db_path)
+        try:
+            done = False
+            while not done:
+                batch = _drain(q, n=64, timeout=1.0)
+                if None in batch:
+                    done = True
+                    batch = [row for row in batch if row is not None]
+                if batch:
+                    ids = insert_papers(conn, batch, replace=replace)
+                    results.extend(_result_from_row(row, pid) for row, pid in zip(batch, ids))
+        finally:
+            conn.close()
+    except BaseException as exc:
+        errors.append(exc)
+
+
+def main_batch(
+    pdf_dir: str | Path,
+    db_path: str | Path,
+    workers: int | None = None,
+    force: bool = False,
+) -> list[dict[str, Any]]:
+    """Analyse tous les PDFs d'un dossier en parallèle.
+
+    Les PDFs sont répartis sur un pool de processus (par défaut un par cœur,
+    au plus MAX_BATCH_WORKERS) ; un seul thread possède la connexion SQLite
+    et écrit la table `papers` par lots. Les processus écrivent eux-mêmes
+    dans `llm_cache` (WAL + busy_timeout sérialisent ces écritures).
+    Les PDFs déjà en BD sont repris tels quels, sauf si `force` est vrai ;
+    un PDF en échec est journalisé et ignoré.
+    """
+    pdf_paths = sorted(Path(pdf_dir).glob("*.pdf"))
+    results: list[dict[str, Any]] = []
+
+    if not force:
+        conn = get_conn(db_path)
+        try:
+            todo = []
+            for pdf_path in pdf_paths:
+                row = get_paper(conn, pdf_path)
+                if row is None:
+                    todo.append(pdf_path)
+                else:
+                    results.append(_result_from_row(row, row["id"]))
+            pdf_paths = todo
+        finally:
+            conn.close()
+
+    n_cpus = os.cpu_count() or 1
+    workers = workers or min(n_cpus, MAX_BATCH_WORKERS)
+
+    q: Queue = Queue()
+    errors: list[BaseException] = []
+    writer = threading.Thread(target=_writer, args=(db_path, q, results, errors, force))
+    writer.start()
+    try:
+        # Un processus par PDF : l'extraction des pages reste séquentielle.
+        # Les cœurs sont partagés entre les processus pour les threads torch.
+        process = partial(_process_safe, cache_db=db_path)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(max(1, n_cpus // workers),),
+        ) as pool:
+            for pdf_path, row, error in pool.map(process, pdf_paths):
+                if error is not None:
+                    logger.warning("Échec de l'analyse de %s : %s", pdf_path, error)
+                elif writer.is_alive():
+                    q.put(row)
+                else:
+                    pool.shutdown(cancel_futures=True)
+                    break
+    finally:
+        q.put(None)
+        writer.join()
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse PDF scientifique")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pdf", help="Chemin vers le PDF")
+    source.add_argument("--pdf-dir", help="Dossier de PDFs à analyser en parallèle")
+    source.add_argument("--dedupe", action="store_true", help="Supprime les doublons d'une ancienne BD")
+    parser.add_argument("--db", default="db/papers.sqlite", help="Chemin vers la BD SQLite")
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Nombre de processus : PDFs avec --pdf-dir (défaut : un par cœur, au plus 4), "
+             "pages d'un long PDF avec --pdf (défaut : 1)",
+    )
+    parser.add_argument("--force", action="store_true", help="Réanalyse les PDFs déjà présents en BD")
+    args = parser.parse_args()
+
+    if args.dedupe:
+        removed = dedupe_papers(args.db)
+        print(json.dumps({"removed_ids": removed}, indent=2))
+        return
+
+    if args.pdf_dir:
+        results = main_batch(args.pdf_dir, args.db, workers=args.workers, force=args.force)
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+
+    # PDF déjà analysé : on renvoie le résultat enregistré
+    conn = get_conn(args.db)
+    cached = None if args.force else get_paper(conn, Path(args.pdf))
+    if cached is not None:
+        print(json.dumps(_result_from_row(cached, cached["id"]), indent=2, ensure_ascii=False))
+        return
+
+    row = process_one_pdf(args.pdf, cache_db=args.db, workers=args.workers)
+
+    # Sauvegarde en BD
+    with transaction(conn):
+        paper_id = insert_paper(conn, row, replace=args.force)
 
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(json.dumps(_result_from_row(row, paper_id), indent=2, ensure_ascii=False))
 
 
 if __name__ == "__main__":
@@ -1,8 +1,11 @@
 """Gestion de la base de données SQLite."""
 from __future__ import annotations
+from contextlib import contextmanager
+from functools import lru_cache
+import logging
 from pathlib import Path
 import sqlite3
-from typing import Any
+from typing import Any, Iterator
 
 
 SCHEMA = """
@@ -21,28 +24,215 @@ CREATE TABLE IF NOT EXISTS papers (
   conclusion_summary TEXT,
   created_at TEXT DEFAULT (datetime('now'))
 );
+
+CREATE TABLE IF NOT EXISTS llm_cache (
+  key TEXT PRIMARY KEY,
+  abstract TEXT,
+  conclusion TEXT
+);
 """
 
+logger = logging.getLogger(__name__)
+
 
 def get_conn(db_path: str | Path) -> sqlite3.Connection:
     """Crée/ouvre la connexion à la BD SQLite."""
+    conn = _connect(db_path)
+    try:
+        _ensure_unique_pdf_path(conn)
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def _connect(db_path: str | Path) -> sqlite3.Connection:
+    """Ouvre la BD, règle les PRAGMAs et crée les tables manquantes."""
     db_path = Path(db_path)
     db_path.parent.mkdir(parents=True, exist_ok=True)
     
-    conn = sqlite3.connect(str(db_path))
+    # Autocommit : les transactions sont ouvertes explicitement via transaction()
+    conn = sqlite3.connect(str(db_path), isolation_level=None)
     conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute(SCHEMA)
-    conn.commit()
+    conn.execute("PRAGMA synchronous=NORMAL;")      # fsync au checkpoint seulement (sûr en WAL)
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-65536;")       # 64 MiB de cache de pages
+    conn.execute("PRAGMA mmap_size=268435456;")     # 256 MiB mappés en mémoire
+    conn.execute("PRAGMA busy_timeout=5000;")
+    conn.executescript(SCHEMA)
     return conn
 
 
-def insert_paper(conn: sqlite3.Connection, data: dict[str, Any]) -> int:
-    """Insère un document dans la BD et retourne son ID."""
-    cols = ", ".join(data.keys())
-    placeholders = ", ".join(["?"] * len(data))
-    
-    cursor = conn.cursor()
-    cursor.execute(f"INSERT INTO papers ({cols}) VALUES ({placeholders})", list(data.values()))
+def _has_unique_index(conn: sqlite3.Connection) -> bool:
+    """Indique si l'index unique sur pdf_path existe déjà."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_papers_pdfpath'"
+    ).fetchone() is not None
+
+
+def _duplicate_ids(conn: sqlite3.Connection) -> list[int]:
+    """IDs des lignes en double (toutes sauf la plus récente de chaque PDF)."""
+    return [
+        row[0] for row in conn.execute(
+            "SELECT id FROM papers WHERE id NOT IN "
+            "(SELECT MAX(id) FROM papers GROUP BY pdf_path) ORDER BY id"
+        )
+    ]
+
+
+def _ensure_unique_pdf_path(conn: sqlite3.Connection) -> None:
+    """Crée l'index unique sur pdf_path.
+
+    Une BD créée avant cet index peut contenir plusieurs lignes pour un même
+    PDF : aucune ligne n'est supprimée ici, on lève une erreur qui renvoie
+    vers la migration explicite `dedupe_papers`.
+    """
+    if _has_unique_index(conn):
+        return
+
+    with transaction(conn):
+        duplicates = _duplicate_ids(conn)
+        if duplicates:
+            raise RuntimeError(
+                f"La BD contient {len(duplicates)} ligne(s) en double sur pdf_path "
+                "(ancienne version du schéma). Lancer `python inference.py --dedupe "
+                "--db <BD>` pour ne garder que la ligne la plus récente de chaque PDF."
+            )
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_papers_pdfpath ON papers(pdf_path)")
+
+
+def dedupe_papers(db_path: str | Path) -> list[int]:
+    """Migration : supprime les doublons de pdf_path puis crée l'index unique.
+
+    Seule la ligne la plus récente (ID max) de chaque PDF est gardée ; les IDs
+    supprimés sont journalisés et retournés.
+    """
+    conn = _connect(db_path)
+    try:
+        with transaction(conn):
+            duplicates = _duplicate_ids(conn)
+            for start in range(0, len(duplicates), 500):
+                ids = duplicates[start:start + 500]
+                conn.execute(
+                    f"DELETE FROM papers WHERE id IN ({', '.join(['?'] * len(ids))})", ids
+                )
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_papers_pdfpath ON papers(pdf_path)")
+    finally:
+        conn.close()
+
+    if duplicates:
+        logger.warning("Doublons supprimés de papers (IDs) : %s", duplicates)
+    return duplicates
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Regroupe les écritures dans une seule transaction (un seul COMMIT).
+
+    Si une transaction est déjà ouverte par l'appelant, on s'y rattache.
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
     conn.commit()
+
+
+def get_paper(conn: sqlite3.Connection, pdf_path: str | Path) -> dict[str, Any] | None:
+    """Retourne la ligne déjà enregistrée pour ce PDF (chemin absolu), sinon None."""
+    cursor = conn.execute(
+        "SELECT * FROM papers WHERE pdf_path = ?", (str(Path(pdf_path).resolve()),)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+def _paper_id(conn: sqlite3.Connection, pdf_path: str) -> int:
+    """Retourne l'ID du document enregistré pour ce PDF."""
+    return int(conn.execute("SELECT id FROM papers WHERE pdf_path = ?", (pdf_path,)).fetchone()[0])
+
+
+@lru_cache(maxsize=32)
+def _insert_sql(cols: tuple[str, ...], replace: bool) -> str:
+    """Construit (une fois par jeu de colonnes ordonné) la requête d'insertion.
+
+    Seul un conflit sur pdf_path est traité (ligne mise à jour ou laissée
+    telle quelle) : les autres contraintes (NOT NULL...) lèvent une erreur.
+    """
+    placeholders = ", ".join(["?"] * len(cols))
+    sql = f"INSERT INTO papers ({', '.join(cols)}) VALUES ({placeholders}) ON CONFLICT(pdf_path) DO "
+    updates = [f"{col} = excluded.{col}" for col in cols if col != "pdf_path"]
+    if replace and updates:
+        return sql + "UPDATE SET " + ", ".join(updates)
+    return sql + "NOTHING"
+
+
+def insert_paper(conn: sqlite3.Connection, data: dict[str, Any], replace: bool = False) -> int:
+    """Insère un document dans la BD et retourne son ID.
+
+    Un PDF déjà présent est ignoré (on retourne l'ID existant), sauf si
+    `replace` est vrai : ses colonnes sont alors mises à jour et son ID conservé.
+    """
+    with transaction(conn):
+        cursor = conn.execute(_insert_sql(tuple(data), replace), tuple(data.values()))
+        # Ligne existante (ignorée ou mise à jour) : lastrowid ne la désigne pas
+        if replace or cursor.rowcount == 0:
+            return _paper_id(conn, data["pdf_path"])
     
     return int(cursor.lastrowid)
+
+
+def insert_papers(
+    conn: sqlite3.Connection, rows: list[dict[str, Any]], replace: bool = False
+) -> list[int]:
+    """Insère plusieurs documents en une transaction et retourne leurs IDs."""
+    if not rows:
+        return []
+
+    keys = tuple(rows[0])
+    if any(tuple(row) != keys for row in rows):
+        raise ValueError("Toutes les lignes doivent avoir les mêmes colonnes")
+
+    with transaction(conn):
+        conn.executemany(
+            _insert_sql(keys, replace),
+            [tuple(row[k] for k in keys) for row in rows],
+        )
+        # Les lignes ignorées ou mises à jour gardent leur ID : lecture via l'index unique
+        return [_paper_id(conn, row["pdf_path"]) for row in rows]
+
+
+def get_llm_cache(conn: sqlite3.Connection, key: str) -> tuple[str | None, str | None] | None:
+    """Retourne (abstract, conclusion) en cache pour cette clé, sinon None.
+
+    Une section jamais générée pour cette clé vaut None.
+    """
+    row = conn.execute(
+        "SELECT abstract, conclusion FROM llm_cache WHERE key = ?", (key,)
+    ).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def put_llm_cache(
+    conn: sqlite3.Connection,
+    key: str,
+    abstract: str | None = None,
+    conclusion: str | None = None,
+) -> None:
+    """Enregistre la sortie du LLM pour cette clé (les sections None sont conservées)."""
+    with transaction(conn):
+        conn.execute(
+            "INSERT INTO llm_cache (key, abstract, conclusion) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "abstract = COALESCE(excluded.abstract, abstract), "
+            "conclusion = COALESCE(excluded.conclusion, conclusion)",
+            (key, abstract, conclusion),
+        )
@@ -1,20 +1,99 @@
-"""Extraction du texte brut d'un fichier PDF."""
+"""Extraction du texte brut d'un fichier PDF.
+
+Le moteur est choisi via la variable d'environnement `PDF_BACKEND` :
+`fitz` (PyMuPDF, par défaut) ou `pdfium` (pypdfium2, extraction native
+sans analyse de mise en page).
+"""
 from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import io
+import os
 from pathlib import Path
+from typing import Iterator
 import fitz
 
 
-def extract_text_from_pdf(pdf_path: str | Path) -> str:
-    """Extrait le texte de toutes les pages d'un PDF."""
+BACKEND = os.environ.get("PDF_BACKEND", "fitz")
+
+# Flags par défaut du mode "text" sans TEXT_PRESERVE_LIGATURES :
+# les ligatures (fi, fl...) sont décomposées, ce qui évite un post-traitement
+_FITZ_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES
+
+# Même sur demande, un pool n'est lancé qu'au-delà de ce nombre de pages :
+# l'extraction séquentielle d'un article (~10 pages) prend ~20 ms, moins
+# que le lancement des processus
+_MIN_PAGES_PARALLEL = 32
+
+
+def _page_count(pdf_path: str, backend: str) -> int:
+    """Retourne le nombre de pages du PDF."""
+    if backend == "pdfium":
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def _iter_page_texts(pdf_path: str, lo: int, hi: int, backend: str) -> Iterator[str]:
+    """Produit le texte des pages [lo, hi) avec le moteur demandé."""
+    if backend == "pdfium":
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            for i in range(lo, hi):
+                # pdfium termine les lignes par "\r\n" : même format que fitz
+                yield pdf[i].get_textpage().get_text_range().replace("\r\n", "\n")
+        finally:
+            pdf.close()
+        return
+
+    with fitz.open(pdf_path) as doc:
+        for i in range(lo, hi):
+            yield doc[i].get_text("text", flags=_FITZ_FLAGS)
+
+
+def _extract_range(pdf_path: str, lo: int, hi: int, backend: str = BACKEND) -> str:
+    """Extrait le texte non vide des pages [lo, hi), une page par bloc."""
+    buf = io.StringIO()
+    for text in _iter_page_texts(pdf_path, lo, hi, backend):
+        if text and not text.isspace():
+            buf.write(text)
+            buf.write("\n")
+    return buf.getvalue()
+
+
+def extract_text_from_pdf(pdf_path: str | Path, workers: int | None = None) -> str:
+    """Extrait le texte de toutes les pages d'un PDF.
+
+    L'extraction est séquentielle par défaut. Avec `workers` > 1, les pages
+    d'un long document sont réparties en plages contiguës sur `workers`
+    processus.
+    """
     pdf_path = Path(pdf_path)
     if not pdf_path.exists():
         raise FileNotFoundError(f"PDF non trouvé : {pdf_path}")
+    if BACKEND not in ("fitz", "pdfium"):
+        raise ValueError(f"PDF_BACKEND inconnu : {BACKEND}")
 
-    pages = []
-    with fitz.open(pdf_path) as doc:
-        for page in doc:
-            text = page.get_text("text")
-            if text.strip():
-                pages.append(text)
+    n_pages = _page_count(str(pdf_path), BACKEND)
+
+    workers = min(workers or 1, n_pages)
+    if workers <= 1 or n_pages <= _MIN_PAGES_PARALLEL:
+        return _extract_range(str(pdf_path), 0, n_pages).strip()
 
-    return "\n".join(pages).strip()
+    step = -(-n_pages // workers)
+    bounds = [(lo, min(lo + step, n_pages)) for lo in range(0, n_pages, step)]
+    with ProcessPoolExecutor(max_workers=len(bounds)) as pool:
+        ranges = pool.map(
+            _extract_range,
+            [str(pdf_path)] * len(bounds),
+            [lo for lo, _ in bounds],
+            [hi for _, hi in bounds],
+            [BACKEND] * len(bounds),
+        )
+        return "".join(ranges).strip()
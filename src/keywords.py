@@ -1,8 +1,20 @@
 """Classification par mots-clés médicaux."""
 from __future__ import annotations
+from collections import Counter
 from dataclasses import dataclass
+from functools import lru_cache
 import re
 
+try:
+    import hyperscan
+except ImportError:  # hyperscan absent (x86 uniquement) : repli sur Aho-Corasick
+    hyperscan = None
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick absent : repli sur les regex compilées
+    ahocorasick = None
+
 
 @dataclass
 class Classification:
@@ -49,21 +61,110 @@ LOCATION_KEYWORDS = {
 }
 
 
-def _count_keyword_hits(text: str, keywords: list[str]) -> int:
-    """Compte les occurrences de mots-clés."""
+def _compile_category(keywords_by_label: dict[str, list[str]]) -> dict[str, list[re.Pattern]]:
+    """Compile chaque mot-clé (en minuscules) séparément, par étiquette.
+
+    Chaque mot-clé est compté pour lui-même, sans chevauchement avec ses
+    propres occurrences : " left left " compte 1 (l'espace est partagé).
+    """
+    return {
+        label: [re.compile(re.escape(kw.lower())) for kw in kws]
+        for label, kws in keywords_by_label.items()
+    }
+
+
+CATEGORY_KEYWORDS = {
+    "region": REGION_KEYWORDS,
+    "type": TYPE_KEYWORDS,
+    "location": LOCATION_KEYWORDS,
+}
+
+CATEGORY_RE = {
+    category: _compile_category(keywords_by_label)
+    for category, keywords_by_label in CATEGORY_KEYWORDS.items()
+}
+
+
+# Liste à plat des mots-clés : l'indice sert d'identifiant de motif
+_KEYWORD_INDEX = [
+    (kw, (category, label))
+    for category, keywords_by_label in CATEGORY_KEYWORDS.items()
+    for label, kws in keywords_by_label.items()
+    for kw in kws
+]
+_KEYWORD_LENGTHS = [len(kw.encode()) for kw, _ in _KEYWORD_INDEX]
+
+
+def _build_hyperscan_db():
+    """Compile tous les mots-clés dans une base Hyperscan (insensible à la casse)."""
+    if hyperscan is None:
+        return None
+
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    db.compile(
+        expressions=[re.escape(kw).encode() for kw, _ in _KEYWORD_INDEX],
+        ids=list(range(len(_KEYWORD_INDEX))),
+        flags=[hyperscan.HS_FLAG_CASELESS] * len(_KEYWORD_INDEX),
+    )
+    return db
+
+
+def _build_automaton():
+    """Construit un automate Aho-Corasick sur tous les mots-clés."""
+    if ahocorasick is None:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for i, (kw, _) in enumerate(_KEYWORD_INDEX):
+        automaton.add_word(kw.lower(), (i, len(kw)))
+    automaton.make_automaton()
+    return automaton
+
+
+_HYPERSCAN_DB = _build_hyperscan_db()
+_AUTOMATON = None if _HYPERSCAN_DB is not None else _build_automaton()
+
+
+def _count_keyword_hits(text: str) -> Counter:
+    """Compte les occurrences de mots-clés par (catégorie, étiquette).
+
+    Comme re.findall, une occurrence qui chevauche la précédente du même
+    mot-clé n'est pas comptée (Hyperscan et Aho-Corasick signalent toutes
+    les occurrences, par position de fin croissante).
+    """
+    counts = Counter()
+    if _HYPERSCAN_DB is not None:
+        next_start = [0] * len(_KEYWORD_INDEX)
+
+        def on_match(pattern_id, start, end, flags, context):
+            if end - _KEYWORD_LENGTHS[pattern_id] >= next_start[pattern_id]:
+                next_start[pattern_id] = end
+                counts[_KEYWORD_INDEX[pattern_id][1]] += 1
+
+        _HYPERSCAN_DB.scan(text.encode(), match_event_handler=on_match)
+        return counts
+
+    if _AUTOMATON is not None:
+        next_start = [0] * len(_KEYWORD_INDEX)
+        for end, (i, length) in _AUTOMATON.iter(text.lower()):
+            if end + 1 - length >= next_start[i]:
+                next_start[i] = end + 1
+                counts[_KEYWORD_INDEX[i][1]] += 1
+        return counts
+
     text = text.lower()
-    count = 0
-    for kw in keywords:
-        count += len(re.findall(re.escape(kw.lower()), text))
-    return count
+    for category, patterns in CATEGORY_RE.items():
+        for label, kw_patterns in patterns.items():
+            counts[(category, label)] = sum(len(p.findall(text)) for p in kw_patterns)
+    return counts
 
 
-def _select_best_locations(text: str, max_count: int = 3) -> list[str]:
+def _select_best_locations(counts: Counter, max_count: int = 3) -> list[str]:
     """Sélectionne les meilleures localisations (évite incohérences)."""
     scores = {
-        loc: _count_keyword_hits(text, kws)
-        for loc, kws in LOCATION_KEYWORDS.items()
-        if _count_keyword_hits(text, kws) > 0
+        loc: counts[("location", loc)]
+        for loc in LOCATION_KEYWORDS
+        if counts[("location", loc)] > 0
     }
     
     if not scores:
@@ -85,26 +186,41 @@ def _select_best_locations(text: str, max_count: int = 3) -> list[str]:
     return result[:max_count]
 
 
-def classify_by_keywords(text: str) -> Classification:
-    """Classifie le texte par région, type et localisation."""
+# inference.py ne classe chaque document qu'une fois : le cache ne sert qu'aux
+# appels répétés sur un même texte, et ne garde que quelques documents en mémoire
+@lru_cache(maxsize=4)
+def _classify_cached(text: str) -> tuple[str, int, tuple[str, ...], tuple[str, ...]]:
+    """Calcule la classification (mise en cache par texte)."""
+    counts = _count_keyword_hits(text)
+
     region_scores = [
-        (region, _count_keyword_hits(text, kws))
-        for region, kws in REGION_KEYWORDS.items()
+        (region, counts[("region", region)])
+        for region in REGION_KEYWORDS
     ]
     best_region, best_score = max(region_scores, key=lambda x: x[1])
     if best_score == 0:
         best_region = "inconnu"
 
     types = [
-        k for k, kws in TYPE_KEYWORDS.items()
-        if _count_keyword_hits(text, kws) > 0
+        k for k in TYPE_KEYWORDS
+        if counts[("type", k)] > 0
     ]
 
-    locations = _select_best_locations(text)
+    locations = _select_best_locations(counts)
+
+    return best_region, best_score, tuple(sorted(set(types))), tuple(locations)
+
+
+def classify_by_keywords(text: str) -> Classification:
+    """Classifie le texte par région, type et localisation.
 
+    Le résultat des derniers textes est mis en cache : un texte classé
+    plusieurs fois de suite n'est analysé qu'une fois.
+    """
+    region, region_score, fracture_types, locations = _classify_cached(text)
     return Classification(
-        region=best_region,
-        region_score=best_score,
-        fracture_types=sorted(set(types)),
-        locations=locations,
+        region=region,
+        region_score=region_score,
+        fracture_types=list(fracture_types),
+        locations=list(locations),
     )
@@ -1,27 +1,126 @@
 """Extraction par LLM (fallback si extraction regex échoue)."""
 from __future__ import annotations
+from contextlib import closing
+from functools import lru_cache
+import hashlib
+import os
+from pathlib import Path
 import re
 from typing import Tuple
-from transformers import pipeline
+
+from src.db import get_conn, get_llm_cache, put_llm_cache
+
+
+# LLM_INT8=1 charge les poids en 8 bits (bitsandbytes, GPU uniquement)
+LLM_INT8 = os.environ.get("LLM_INT8", "") == "1"
+
+PROMPT_ABS = "Extract ONLY the Abstract text from the scientific article. If no abstract exists, output EMPTY.\n\nTEXT:\n"
+PROMPT_CONC = "Extract ONLY the Conclusion(s) text from the scientific article. If no conclusion exists, output EMPTY.\n\nTEXT:\n"
+
+# Section -> (prompt, chunk utilisé) : l'abstract est au début, la conclusion à la fin
+_SECTIONS = {
+    "abstract": (PROMPT_ABS, 0),
+    "conclusion": (PROMPT_CONC, -1),
+}
+
+# Borne large du nombre de caractères par token (~4 en pratique)
+_CHARS_PER_TOKEN = 8
+
+_PREFIX_RE = re.compile(r"^(?:abstract|conclusions?)\s*:\s*", re.IGNORECASE)
+_NEWLINES_RE = re.compile(r"\n{3,}")
+
+
+def _bf16_supported(torch) -> bool:
+    """Indique si le matériel exécute nativement le bfloat16.
+
+    Sur CPU, il faut AVX-512-BF16 ou AMX : ailleurs le bfloat16 est émulé et
+    plus lent que le float32.
+    """
+    if torch.cuda.is_available():
+        return torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+@lru_cache(maxsize=2)
+def _get_pipeline(model_name: str):
+    """Charge le pipeline text2text en cache (une fois par modèle).
+
+    Les poids sont chargés en bfloat16 si le matériel le supporte (T5 déborde
+    en float16), sinon en float32, ou en 8 bits si LLM_INT8=1 et qu'un GPU est
+    disponible. transformers n'est importé qu'ici : importer ce module ne
+    charge pas de modèle.
+    """
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if LLM_INT8 and torch.cuda.is_available():
+        from transformers import BitsAndBytesConfig
+        model = AutoModelForSeq2SeqLM.from_pretrained(
+            model_name,
+            quantization_config=BitsAndBytesConfig(load_in_8bit=True),
+            device_map="auto",
+            low_cpu_mem_usage=True,
+        )
+    else:
+        use_bf16 = _bf16_supported(torch)
+        model = AutoModelForSeq2SeqLM.from_pretrained(
+            model_name,
+            torch_dtype=torch.bfloat16 if use_bf16 else torch.float32,
+            device_map="auto",
+            low_cpu_mem_usage=True,
+        )
+
+    gen = pipeline("text2text-generation", model=model, tokenizer=tokenizer)
+    # Padding requis pour générer abstract et conclusion dans un même batch
+    gen.tokenizer.padding_side = "left"
+    if gen.tokenizer.pad_token_id is None:
+        gen.tokenizer.pad_token_id = gen.tokenizer.eos_token_id
+    return gen
+
+
+@lru_cache(maxsize=2)
+def _max_text_tokens(model_name: str) -> int:
+    """Calcule les tokens disponibles pour le texte (hors prompt)."""
+    tokenizer = _get_pipeline(model_name).tokenizer
+    prompt_tokens = max(
+        len(tokenizer.encode(PROMPT_ABS, add_special_tokens=False)),
+        len(tokenizer.encode(PROMPT_CONC, add_special_tokens=False)),
+    )
+    return max(256, (tokenizer.model_max_length or 512) - prompt_tokens - 32)
 
 
 def _normalize(text: str) -> str:
     """Normalise le texte."""
     text = text.replace("\r", "\n")
-    return re.sub(r"\n{3,}", "\n\n", text).strip()
+    return _NEWLINES_RE.sub("\n\n", text).strip()
 
 
 def _clean_output(text: str) -> str:
     """Nettoie la sortie du modèle LLM."""
-    text = text.strip()
-    text = re.sub(r"(?i)^abstract\s*:\s*", "", text).strip()
-    text = re.sub(r"(?i)^conclusion(s)?\s*:\s*", "", text).strip()
-    return text.strip()
+    return _PREFIX_RE.sub("", text.strip()).strip()
 
 
 def _chunk_text(text: str, tokenizer, max_tokens: int = 512) -> list[str]:
-    """Divise le texte en chunks selon la limite du modèle."""
+    """Divise le texte en chunks selon la limite du modèle.
+
+    Pour un texte long, seuls le début (abstract) et la fin (conclusion)
+    sont utilisés : on ne tokenise que ces deux fenêtres.
+    """
     text = _normalize(text)
+
+    window = _CHARS_PER_TOKEN * max_tokens
+    if len(text) > 2 * window:
+        head_ids = tokenizer.encode(text[:window], add_special_tokens=False)[:max_tokens]
+        tail_ids = tokenizer.encode(text[-window:], add_special_tokens=False)[-max_tokens:]
+        return [
+            tokenizer.decode(head_ids, skip_special_tokens=True).strip(),
+            tokenizer.decode(tail_ids, skip_special_tokens=True).strip(),
+        ]
+
     token_ids = tokenizer.encode(text, add_special_tokens=False)
 
     if len(token_ids) <= max_tokens:
@@ -50,50 +149,99 @@ def _fallback_first_paragraphs(text: str, max_words: int = 180) -> str:
     return " ".join(words[:max_words]).strip()
 
 
-def llm_extract_abstract_conclusion(
+def _cache_key(raw_text: str, model_name: str) -> str:
+    """Clé de cache : empreinte du modèle et du texte d'entrée."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(model_name.encode())
+    h.update(b"\0")
+    h.update(raw_text.encode())
+    return h.hexdigest()
+
+
+def _generate_sections(
+    raw_text: str, sections: tuple[str, ...], model_name: str
+) -> dict[str, str] | None:
+    """Génère les sections demandées en un seul batch ; None si échec."""
+    gen = _get_pipeline(model_name)
+    chunks = _chunk_text(raw_text, gen.tokenizer, max_tokens=_max_text_tokens(model_name))
+
+    inputs = [_SECTIONS[name][0] + chunks[_SECTIONS[name][1]] for name in sections]
+    try:
+        outs = gen(
+            inputs,
+            max_new_tokens=220,
+            do_sample=False,
+            num_beams=1,
+            use_cache=True,
+            batch_size=len(inputs),
+        )
+    except Exception:
+        return None
+
+    extracted = {}
+    for name, out in zip(sections, outs):
+        text = _clean_output(out["generated_text"])
+        extracted[name] = "" if text.upper() == "EMPTY" else text
+    return extracted
+
+
+def _llm_extract(
     raw_text: str,
-    model_name: str = "google/flan-t5-base",
-) -> Tuple[str, str]:
-    """Extrait abstract et conclusion avec un modèle LLM."""
+    sections: tuple[str, ...],
+    model_name: str,
+    cache_db: str | Path | None,
+) -> dict[str, str]:
+    """Extrait les sections demandées, via le cache `llm_cache` si fourni."""
     raw_text = _normalize(raw_text)
 
-    gen = pipeline("text2text-generation", model=model_name)
-    tokenizer = gen.tokenizer
+    if cache_db is None:
+        extracted = _generate_sections(raw_text, sections, model_name) or {}
+    else:
+        key = _cache_key(raw_text, model_name)
+        with closing(get_conn(cache_db)) as conn:
+            cached = dict(zip(("abstract", "conclusion"), get_llm_cache(conn, key) or ()))
+            extracted = {name: cached[name] for name in sections if cached.get(name) is not None}
+            missing = tuple(name for name in sections if name not in extracted)
+            if missing:
+                generated = _generate_sections(raw_text, missing, model_name)
+                if generated is not None:
+                    put_llm_cache(conn, key, **generated)
+                    extracted.update(generated)
 
-    # Calcule les tokens disponibles pour le texte
-    prompt_abs = "Extract ONLY the Abstract text from the scientific article. If no abstract exists, output EMPTY.\n\nTEXT:\n"
-    prompt_conc = "Extract ONLY the Conclusion(s) text from the scientific article. If no conclusion exists, output EMPTY.\n\nTEXT:\n"
+    # Fallback : si abstract absent, prend les premiers paragraphes
+    if "abstract" in sections and not extracted.get("abstract"):
+        extracted["abstract"] = _fallback_first_paragraphs(raw_text)
 
-    prompt_tokens = max(
-        len(tokenizer.encode(prompt_abs, add_special_tokens=False)),
-        len(tokenizer.encode(prompt_conc, add_special_tokens=False)),
-    )
-    max_tokens = max(256, (tokenizer.model_max_length or 512) - prompt_tokens - 32)
+    return {name: extracted.get(name, "").strip() for name in sections}
 
-    chunks = _chunk_text(raw_text, tokenizer, max_tokens=max_tokens)
 
-    # Extrait l'abstract du premier chunk
-    abstract = ""
-    try:
-        out = gen(prompt_abs + chunks[0], max_new_tokens=220, do_sample=False)[0]["generated_text"]
-        abstract = _clean_output(out)
-        if abstract.upper() == "EMPTY":
-            abstract = ""
-    except Exception:
-        pass
+def llm_extract_abstract(
+    raw_text: str,
+    model_name: str = "google/flan-t5-base",
+    cache_db: str | Path | None = None,
+) -> str:
+    """Extrait uniquement l'abstract (début du texte) avec un modèle LLM."""
+    return _llm_extract(raw_text, ("abstract",), model_name, cache_db)["abstract"]
 
-    # Extrait la conclusion du dernier chunk
-    conclusion = ""
-    try:
-        out = gen(prompt_conc + chunks[-1], max_new_tokens=220, do_sample=False)[0]["generated_text"]
-        conclusion = _clean_output(out)
-        if conclusion.upper() == "EMPTY":
-            conclusion = ""
-    except Exception:
-        pass
 
-    # Fallback : si abstract absent, prend les premiers paragraphes
-    if not abstract:
-        abstract = _fallback_first_paragraphs(raw_text)
+def llm_extract_conclusion(
+    raw_text: str,
+    model_name: str = "google/flan-t5-base",
+    cache_db: str | Path | None = None,
+) -> str:
+    """Extrait uniquement la conclusion (fin du texte) avec un modèle LLM."""
+    return _llm_extract(raw_text, ("conclusion",), model_name, cache_db)["conclusion"]
+
+
+def llm_extract_abstract_conclusion(
+    raw_text: str,
+    model_name: str = "google/flan-t5-base",
+    cache_db: str | Path | None = None,
+) -> Tuple[str, str]:
+    """Extrait abstract et conclusion avec un modèle LLM.
 
-    return abstract.strip(), conclusion.strip()
+    Si `cache_db` est fourni, la sortie du modèle est mise en cache dans la
+    table `llm_cache` de cette BD, par empreinte du texte.
+    """
+    extracted = _llm_extract(raw_text, ("abstract", "conclusion"), model_name, cache_db)
+    return extracted["abstract"], extracted["conclusion"]
@@ -1,29 +1,58 @@
 """Extraction des sections Abstract et Conclusion."""
 from __future__ import annotations
+from functools import lru_cache
 import re
-from typing import Tuple
+from typing import Sequence, Tuple
+
+
+ABSTRACT_TITLES = ["Abstract", "ABSTRACT", "Résumé", "RESUME"]
+CONCLUSION_TITLES = ["Conclusion", "Conclusions", "CONCLUSION", "CONCLUSIONS"]
+STOP_TITLES = [
+    "Introduction", "Methods", "Materials and Methods", "Results",
+    "Discussion", "Keywords", "References", "Acknowledgements",
+    "Supplementary materials", "Author Contribution"
+]
+
+
+@lru_cache(maxsize=32)
+def _compile_titles(titles: tuple[str, ...]) -> re.Pattern:
+    """Compile (une fois par liste) le motif d'une ligne égale à l'un des titres."""
+    return re.compile(r"(?im)^(?:%s)\s*$" % "|".join(map(re.escape, titles)))
+
+
+_NEWLINES_RE = re.compile(r"\n{3,}")
+_ABSTRACT_RE = re.compile(
+    r"^\s*abstract\s*:\s*(.+?)(?=^\s*\d+\.\s+|\n\s*keywords\s*:|\n\s*introduction\s*|\Z)",
+    re.MULTILINE | re.IGNORECASE | re.DOTALL,
+)
+_CONCLUSION_RE = re.compile(
+    r"^\s*(\d+\.\s*)?conclusions?\s*:\s*(.+?)(?=^\s*author contributions|^\s*funding|^\s*references|\Z)",
+    re.MULTILINE | re.IGNORECASE | re.DOTALL,
+)
+
+_STOP_ABSTRACT_TITLES = tuple(STOP_TITLES + CONCLUSION_TITLES)
+_STOP_CONC_TITLES = tuple(STOP_TITLES + ["References"])
 
 
 def _normalize(text: str) -> str:
     """Normalise les sauts de ligne et espaces."""
     text = text.replace("\r", "\n")
-    return re.sub(r"\n{3,}", "\n\n", text)
+    return _NEWLINES_RE.sub("\n\n", text)
 
 
-def _find_section(text: str, start_titles: list[str], stop_titles: list[str]) -> str:
-    """Trouve une section entre ses titres de début et fin."""
-    text = _normalize(text)
-    
-    start_pattern = r"(?im)^(?:%s)\s*$" % "|".join(map(re.escape, start_titles))
-    match = re.search(start_pattern, text)
+def _find_section(text: str, start_titles: Sequence[str], stop_titles: Sequence[str]) -> str:
+    """Trouve une section entre ses titres de début et fin.
+
+    `text` doit déjà être normalisé (voir `_normalize`).
+    """
+    match = _compile_titles(tuple(start_titles)).search(text)
     if not match:
         return ""
 
     start_idx = match.end()
-    stop_pattern = r"(?im)^(?:%s)\s*$" % "|".join(map(re.escape, stop_titles))
-    stop_match = re.search(stop_pattern, text[start_idx:])
-    
-    end_idx = start_idx + (stop_match.start() if stop_match else len(text) - start_idx)
+    stop_match = _compile_titles(tuple(stop_titles)).search(text, start_idx)
+
+    end_idx = stop_match.start() if stop_match else len(text)
     return text[start_idx:end_idx].strip()
 
 
@@ -31,33 +60,21 @@ def extract_abstract_and_conclusion(text: str) -> Tuple[str, str]:
     """Extrait les sections Abstract et Conclusion du texte."""
     text = _normalize(text)
 
-    abstract_pattern = r"(?im)^\s*abstract\s*:\s*(.+?)(?=^\s*\d+\.\s+|\n\s*keywords\s*:|\n\s*introduction\s*|\Z)"
-    conclusion_pattern = r"(?im)^\s*(\d+\.\s*)?conclusions?\s*:\s*(.+?)(?=^\s*author contributions|^\s*funding|^\s*references|\Z)"
-
     abstract = ""
     conclusion = ""
 
-    m = re.search(abstract_pattern, text, flags=re.MULTILINE | re.IGNORECASE | re.DOTALL)
+    m = _ABSTRACT_RE.search(text)
     if m:
         abstract = m.group(1).strip()
 
-    m = re.search(conclusion_pattern, text, flags=re.MULTILINE | re.IGNORECASE | re.DOTALL)
+    m = _CONCLUSION_RE.search(text)
     if m:
         conclusion = m.group(2).strip()
 
     # Fallback sur les titres de section
-    if not abstract or not conclusion:
-        abstract_titles = ["Abstract", "ABSTRACT", "Résumé", "RESUME"]
-        conclusion_titles = ["Conclusion", "Conclusions", "CONCLUSION", "CONCLUSIONS"]
-        stop_titles = [
-            "Introduction", "Methods", "Materials and Methods", "Results",
-            "Discussion", "Keywords", "References", "Acknowledgements",
-            "Supplementary materials", "Author Contribution"
-        ]
-
-        if not abstract:
-            abstract = _find_section(text, abstract_titles, stop_titles + conclusion_titles)
-        if not conclusion:
-            conclusion = _find_section(text, conclusion_titles, stop_titles + ["References"])
+    if not abstract:
+        abstract = _find_section(text, ABSTRACT_TITLES, _STOP_ABSTRACT_TITLES)
+    if not conclusion:
+        conclusion = _find_section(text, CONCLUSION_TITLES, _STOP_CONC_TITLES)
 
     return abstract.strip(), conclusion.strip()
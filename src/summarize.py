@@ -2,44 +2,250 @@
 
 Nettoie le texte et génère des résumés via DistilBART,
 avec support pour textes longs via division en chunks.
+
+Le modèle est chargé au premier résumé ; appeler `warmup()` au démarrage
+(ou en initializer d'un pool de processus) pour payer ce coût d'avance.
+transformers n'est importé qu'au chargement du tokenizer ou du modèle :
+importer ce module (et nettoyer du texte) ne charge pas la pile ML.
 """
 from __future__ import annotations
 from functools import lru_cache
+import hashlib
+import logging
+import os
+from pathlib import Path
 import re
-from transformers import pipeline
+import shutil
+
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "sshleifer/distilbart-cnn-12-6"
+
+# Modèle ONNX quantifié (CPU) et résumés déjà calculés, réutilisés d'un run à l'autre
+CACHE_DIR = Path(os.environ.get("PDFDOCTOR_CACHE_DIR", "~/.cache/pdfdoctor")).expanduser()
+
+
+_NEWLINES_RE = re.compile(r"\n{3,}")
+
+# Passes dans l'ordre d'origine, dont le résultat dépend : liens, DOI, lignes
+# de pied de page, appels de citation, puis lignes de références (reconnues
+# une fois les marqueurs retirés : "[1]A.B; J Bone 2020" est supprimée).
+# Les motifs purement ASCII s'appliquent au texte encodé en UTF-8, où sre
+# parcourt les bytes plus vite que le str ; pas le DOI, dont le \b dépend des
+# lettres accentuées qui précèdent.
+_LINK_RE = re.compile(rb"https?://\S+|www\.\S+")
+_DOI_RE = re.compile(r"\bdoi:\s*\S+", re.IGNORECASE)
+
+# Lignes de pied de page / métadonnées de revue (y compris "[CrossRef]")
+_FOOTER_LINE_RE = re.compile(
+    r"^.*(?:crossref|open[^\S\n]+access|license|pmcid|pmid|issn).*\n?",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# "[CrossRef]" n'y figure pas : sa ligne est déjà supprimée
+_CITATION_RE = re.compile(rb"\[\d+(?:,\s*\d+)*\]|(?i:\[(?:PubMed|PMC|Medline)\])")
+
+# Références bibliographiques ("A.B; ... 2020")
+_BIBLIO_LINE_RE = re.compile(
+    r"^[A-Z]\.[A-Z]?;.*(?:\d{4}|doi|Surg|Rev|J\.|Lancet).*\n?",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# Normalisation des espaces et de la ponctuation
+_SPACES_RE = re.compile(r"[\t ]{2,}|\t")
+_SPACE_BEFORE_PUNCT_RE = re.compile(r"\s+([.!?,;:])")
+_SENTENCE_GAP_RE = re.compile(r"([.!?])\s*([A-Z])")
+_LEADING_JUNK_RE = re.compile(r"^[\W\d_]+\s*", re.MULTILINE)
+
+# Taille des lots de chunks passés au modèle, et longueur minimale d'un chunk
+# (en tokens de texte, hors tokens spéciaux)
+_BATCH_SIZE = 8
+_MIN_CHUNK_TOKENS = 20
+
+# Marqueurs d'une ligne de références (en minuscules : appliqué à la ligne
+# passée en minuscules), et suite d'initiales d'auteurs ("A.; B.;")
+_REF_LINE_RE = re.compile(r"\[\d+\]|\d{1,2}\.|\[pubmed\]|\[crossref\]|doi:|https://doi\.org/")
+_AUTHOR_RE = re.compile(r"[A-Z]\.;\s*[A-Z]\.;")
+
+# Phrase : texte jusqu'à une ponctuation finale suivie d'un espace (ou fin du texte)
+_SENT_RE = re.compile(r"([^.!?]*(?:[.!?](?!\s)[^.!?]*)*[.!?]?)\s*")
+
+# Phrases non cliniques à écarter avant résumé (motifs en minuscules,
+# appliqués à la phrase passée en minuscules : plus rapide que IGNORECASE)
+BLACKLIST = [
+    r"endnote", r"software", r"statistical analysis", r"ibm", r"spss",
+    r"database", r"search strategy", r"screened", r"p\s*[<|=]\s*0\.\d+",
+    r"crossref", r"doi\s*:", r"https?://doi\.org/", r"open access",
+    r"references", r"pmcid", r"pmid", r"issn",
+]
+# Chaque motif est isolé dans un groupe : un "|" ajouté dans un motif
+# ne peut pas déborder sur ses voisins
+_BLACKLIST_RE = re.compile("|".join(f"(?:{p})" for p in BLACKLIST))
+
+
+class SummarizationError(RuntimeError):
+    """La génération du résumé a échoué (le texte n'a pas été résumé)."""
+
+
+def _build_dir(final_dir: Path, build) -> None:
+    """Crée `final_dir` de façon atomique via `build(tmp_dir)`.
+
+    Chaque processus construit dans son propre répertoire temporaire puis le
+    renomme : un répertoire final n'est jamais partiel, et si un autre
+    processus a fini avant, son résultat est conservé.
+    """
+    if final_dir.exists():
+        return
+
+    final_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = final_dir.with_name(f"{final_dir.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    try:
+        build(tmp_dir)
+        try:
+            tmp_dir.rename(final_dir)
+        except OSError:
+            if not final_dir.exists():
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _onnx_int8_dir(model_name: str) -> Path:
+    """Répertoire du modèle ONNX quantifié en int8, dans CACHE_DIR."""
+    return CACHE_DIR / model_name.replace("/", "--") / "onnx-int8"
+
+
+def _build_onnx_int8(model_name: str) -> Path:
+    """Exporte le modèle en ONNX et le quantifie en int8 (poids dynamiques).
+
+    L'export et la quantification ne sont faits qu'une fois : le résultat
+    est conservé dans CACHE_DIR (voir `_build_dir`).
+    """
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    int8_dir = _onnx_int8_dir(model_name)
+    onnx_dir = int8_dir.with_name("onnx")
+
+    def export(tmp_dir: Path) -> None:
+        ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True).save_pretrained(tmp_dir)
+
+    def quantize(tmp_dir: Path) -> None:
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        for onnx_file in sorted(onnx_dir.glob("*.onnx")):
+            quantizer = ORTQuantizer.from_pretrained(onnx_dir, file_name=onnx_file.name)
+            quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+
+    if not int8_dir.exists():
+        _build_dir(onnx_dir, export)
+        _build_dir(int8_dir, quantize)
+    return int8_dir
+
+
+def _load_onnx_int8(model_name: str):
+    """Charge le modèle ONNX int8 construit par `_build_onnx_int8`."""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    int8_dir = _onnx_int8_dir(model_name)
+    files = {p.name.replace("_quantized.onnx", ""): p.name for p in int8_dir.glob("*_quantized.onnx")}
+    kwargs = {
+        f"{part}_file_name": files[key]
+        for part, key in (
+            ("encoder", "encoder_model"),
+            ("decoder", "decoder_model"),
+            ("decoder_with_past", "decoder_with_past_model"),
+        )
+        if key in files
+    }
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        int8_dir, provider="CPUExecutionProvider", **kwargs
+    )
+
+
+@lru_cache(maxsize=1)
+def _tokenizer():
+    """Charge le tokenizer DistilBART en cache (sans les poids du modèle)."""
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(MODEL_NAME)
+
+
+@lru_cache(maxsize=1)
+def _backend() -> str:
+    """Moteur du modèle de résumé : "cuda-fp16", "onnx-int8" ou "cpu-fp32".
+
+    Sur CPU, la version ONNX int8 est utilisée si optimum[onnxruntime] est
+    installé et que l'export/quantification réussit ; sinon le modèle PyTorch
+    float32 est utilisé. Le choix est fait une fois par processus.
+    """
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda-fp16"
+    try:
+        import optimum.onnxruntime  # noqa: F401
+    except ImportError:
+        return "cpu-fp32"
+    try:
+        _build_onnx_int8(MODEL_NAME)
+    except Exception as exc:
+        logger.warning("Modèle ONNX int8 indisponible, repli sur PyTorch float32 : %s", exc)
+        return "cpu-fp32"
+    return "onnx-int8"
 
 
 @lru_cache(maxsize=1)
 def _summarizer():
-    """Charge le modèle DistilBART en cache."""
+    """Charge le modèle DistilBART en cache, selon `_backend()`.
+
+    Sur GPU, le modèle est chargé en float16 ; les chunks d'un même texte
+    sont traités par lots de 8.
+    """
+    import torch
+    from transformers import pipeline
+
+    backend = _backend()
+    if backend == "onnx-int8":
+        return pipeline(
+            "summarization",
+            model=_load_onnx_int8(MODEL_NAME),
+            tokenizer=_tokenizer(),
+            clean_up_tokenization_spaces=True,
+            batch_size=_BATCH_SIZE,
+        )
+
+    device = 0 if backend == "cuda-fp16" else -1
     return pipeline(
         "summarization",
-        model="sshleifer/distilbart-cnn-12-6",
+        model=MODEL_NAME,
+        tokenizer=_tokenizer(),
         clean_up_tokenization_spaces=True,
+        device=device,
+        torch_dtype=torch.float16 if device == 0 else None,
+        batch_size=_BATCH_SIZE,
     )
 
 
+def warmup() -> None:
+    """Charge le tokenizer et le modèle de résumé sans attendre le premier appel."""
+    _summarizer()
+
+
 def _is_reference_section(text: str) -> bool:
     """Détecte si le texte est une section de références."""
     if not text:
         return False
 
     lines = text.strip().split("\n")
-    
-    ref_patterns = [
-        r"\[\d+\]", r"\d{1,2}\.", r"\[PubMed\]",
-        r"\[CrossRef\]", r"doi:", r"https://doi\.org/",
-    ]
 
-    ref_count = sum(
-        1 for line in lines[:min(20, len(lines))]
-        if any(re.search(p, line, re.IGNORECASE) for p in ref_patterns)
-    )
+    ref_count = sum(1 for line in lines[:20] if _REF_LINE_RE.search(line.lower()))
 
     if len(lines) > 10 and ref_count > len(lines) * 0.6:
         return True
 
-    author_count = len(re.findall(r"[A-Z]\.;\s*[A-Z]\.;", text))
+    author_count = len(_AUTHOR_RE.findall(text))
     return author_count > 5 and len(text.split()) > 100
 
 
@@ -48,41 +254,29 @@ def clean_extracted_text(text: str) -> str:
     text = (text or "").strip()
     if not text or _is_reference_section(text):
         return ""
+    return _clean_text(text)
 
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
-    text = re.sub(r"\n{3,}", "\n\n", text)
+
+def _clean_text(text: str) -> str:
+    """Nettoie un texte non vide dont on sait qu'il n'est pas une section de références."""
+    # "\r\n" devient "\n\n" : les lignes vides disparaissent à la fin du nettoyage
+    text = _NEWLINES_RE.sub("\n\n", text.replace("\r", "\n"))
 
     # Supprime URLs et DOI
-    text = re.sub(r"https?://[^\s]+", "", text)
-    text = re.sub(r"www\.[^\s]+", "", text)
-    text = re.sub(r"\bdoi:\s*[^\s]+", "", text, flags=re.IGNORECASE)
-
-    # Supprime marqueurs de bruit
-    footer_noise = [
-        r"(?i)crossref", r"(?i)open\s+access", r"(?i)license",
-        r"(?i)pmcid", r"(?i)pmid", r"(?i)issn",
-    ]
-    text = "\n".join(
-        line for line in text.split("\n")
-        if not any(re.search(pat, line) for pat in footer_noise)
-    )
+    text = _DOI_RE.sub("", _LINK_RE.sub(b"", text.encode("utf-8")).decode("utf-8"))
 
-    # Supprime références et métadonnées
-    text = re.sub(r"\[\d+(?:,\s*\d+)*\]", "", text)
-    text = re.sub(r"\[(?:PubMed|CrossRef|PMC|Medline)\]", "", text, flags=re.IGNORECASE)
-    
-    ref_pattern = r"^[A-Z]\.[A-Z]?;.*(?:\d{4}|doi|Surg|Rev|J\.|Lancet)"
-    text = "\n".join(
-        line for line in text.split("\n")
-        if not re.match(ref_pattern, line, flags=re.IGNORECASE)
-    )
+    # Supprime les lignes de pied de page
+    text = _FOOTER_LINE_RE.sub("", text)
+
+    # Supprime appels de citation, puis lignes de références
+    text = _CITATION_RE.sub(b"", text.encode("utf-8")).decode("utf-8")
+    text = _BIBLIO_LINE_RE.sub("", text)
 
     # Nettoie espaces
-    text = re.sub(r"\t+", " ", text)
-    text = re.sub(r" {2,}", " ", text)
-    text = re.sub(r"\s+([.!?,;:])", r"\1", text)
-    text = re.sub(r"([.!?])\s*([A-Z])", r"\1 \2", text)
-    text = re.sub(r"^[\W\d_]+\s*", "", text, flags=re.MULTILINE)
+    text = _SPACES_RE.sub(" ", text)
+    text = _SPACE_BEFORE_PUNCT_RE.sub(r"\1", text)
+    text = _SENTENCE_GAP_RE.sub(r"\1 \2", text)
+    text = _LEADING_JUNK_RE.sub("", text)
 
     text = "\n\n".join(
         block for block in (line.strip() for line in text.split("\n"))
@@ -93,89 +287,140 @@ def clean_extracted_text(text: str) -> str:
 
 def _clean_for_summary(text: str) -> str:
     """Supprime les phrases non cliniques."""
-    if _is_reference_section(text):
-        return ""
-
-    blacklist = [
-        r"endnote", r"software", r"statistical analysis", r"ibm", r"spss",
-        r"database", r"search strategy", r"screened", r"p\s*[<|=]\s*0\.\d+",
-        r"crossref", r"doi\s*:", r"https?://doi\.org/", r"open access",
-        r"references", r"pmcid", r"pmid", r"issn",
-    ]
-
-    sentences = re.split(r"(?<=[.!?])\s+", text)
+    # Texte déjà sans espaces aux bords : les phrases n'ont pas à être strip()
     kept = [
-        s.strip() for s in sentences
-        if s.strip() and not any(re.search(b, s.lower()) for b in blacklist)
+        s for m in _SENT_RE.finditer(text.strip())
+        if (s := m.group(1)) and not _BLACKLIST_RE.search(s.lower())
     ]
-    return " ".join(kept).strip()
+    return " ".join(kept)
+
+
+def _encode_chunks(text: str, tokenizer, max_tokens: int = 512):
+    """Tokenise le texte en fenêtres successives de `max_tokens` tokens.
+
+    Retourne un batch (une ligne par chunk) directement utilisable par le modèle.
+    """
+    enc = tokenizer(
+        text,
+        max_length=max_tokens,
+        truncation=True,
+        stride=0,
+        return_overflowing_tokens=True,
+        padding=True,
+        return_tensors="pt",
+    )
+    enc.pop("overflow_to_sample_mapping", None)
+    return enc
 
 
-def _split_into_chunks(text: str, tokenizer, max_tokens: int = 512) -> list[str]:
-    """Divise le texte en chunks respectant la limite de tokens."""
-    if not text:
-        return []
+def _valid_summary(summary: str) -> str:
+    """Retourne le résumé s'il est exploitable, sinon une chaîne vide."""
+    summary = (summary or "").strip()
+    if len(summary.split()) < 5:
+        return ""
+    if re.search(r"(?i)\bcrossref\b|\bdoi\b|open\s+access|\[pubmed\]|\[crossref\]", summary):
+        return ""
+    if _is_reference_section(summary):
+        return ""
+    if len(re.findall(r"\d{4}", summary)) > 3:
+        return ""
+    return summary
+
+
+def _generate_summaries(enc, max_length: int = 150, min_length: int = 100) -> list[str]:
+    """Résume chaque ligne d'un batch tokenisé, par lots de _BATCH_SIZE.
+
+    Retourne un résumé par ligne (chaîne vide si la ligne est trop courte ou
+    si le résumé est rejeté). Le modèle n'est chargé que s'il y a à générer ;
+    une erreur de chargement est propagée telle quelle, une erreur pendant la
+    génération (mémoire, ONNX Runtime...) lève SummarizationError.
+    """
+    tokenizer = _tokenizer()
+    n_tokens = enc["attention_mask"].sum(dim=1).tolist()
+    n_special = tokenizer.num_special_tokens_to_add()
+    summaries = [""] * len(n_tokens)
+    rows = [i for i, n in enumerate(n_tokens) if n - n_special >= _MIN_CHUNK_TOKENS]
+    if not rows:
+        return summaries
+
+    model = _summarizer().model
+    for start in range(0, len(rows), _BATCH_SIZE):
+        batch_rows = rows[start:start + _BATCH_SIZE]
+        batch = {k: v[batch_rows].to(model.device) for k, v in enc.items()}
+        try:
+            out_ids = model.generate(
+                **batch, max_length=max_length, min_length=min_length, do_sample=False
+            )
+        except Exception as exc:
+            logger.warning("Échec de la génération du résumé : %s", exc)
+            raise SummarizationError(str(exc)) from exc
+        texts = tokenizer.batch_decode(
+            out_ids, skip_special_tokens=True, clean_up_tokenization_spaces=True
+        )
+        for i, text in zip(batch_rows, texts):
+            summaries[i] = _valid_summary(text)
+    return summaries
+
+
+def _summarize_chunk(text: str, max_length: int = 150, min_length: int = 100) -> str:
+    """Résume un chunk individuel."""
+    if not text or len(text.split()) < 20:
+        return ""
 
-    token_ids = tokenizer.encode(text, add_special_tokens=False)
-    if len(token_ids) <= max_tokens:
-        return [text]
+    enc = _tokenizer()(text, truncation=True, return_tensors="pt")
+    return _generate_summaries(enc, max_length, min_length)[0]
 
-    chunks = []
-    for i in range(0, len(token_ids), max_tokens):
-        chunk_ids = token_ids[i:i + max_tokens]
-        chunk = tokenizer.decode(chunk_ids, skip_special_tokens=True).strip()
-        if chunk:
-            chunks.append(chunk)
-    return chunks
 
+def _cache_path(text: str, max_length: int, min_length: int) -> Path:
+    """Fichier de cache du résumé : empreinte du modèle, du moteur, des paramètres et du texte."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{MODEL_NAME}\0{_backend()}\0{max_length}\0{min_length}\0".encode())
+    h.update(text.encode())
+    return CACHE_DIR / "summaries" / f"{h.hexdigest()}.txt"
 
-def _summarize_chunk(text: str, summarizer, max_length: int = 150, min_length: int = 100) -> str:
-    """Résume un chunk individuel."""
-    if not text or len(text.split()) < 20 or _is_reference_section(text):
-        return ""
 
+def _summarize_cached(text: str, max_length: int, min_length: int) -> str:
+    """Résume un texte nettoyé, via le cache disque si le résumé existe déjà.
+
+    Une erreur du modèle est propagée : rien n'est alors mis en cache.
+    """
+    path = _cache_path(text, max_length, min_length)
     try:
-        out = summarizer(text, max_length=max_length, min_length=min_length, do_sample=False, truncation=True)
-        summary = (out[0].get("summary_text") or "").strip()
-
-        if len(summary.split()) < 5:
-            return ""
-        if re.search(r"(?i)\bcrossref\b|\bdoi\b|open\s+access|\[pubmed\]|\[crossref\]", summary):
-            return ""
-        if _is_reference_section(summary):
-            return ""
-        if len(re.findall(r"\d{4}", summary)) > 3:
-            return ""
-
-        return summary
-    except Exception:
-        return ""
+        return path.read_text(encoding="utf-8")
+    except OSError:
+        pass
 
+    summary = _summarize_text(text, max_length, min_length)
 
-def summarize(text: str, max_length: int = 200, min_length: int = 150) -> str:
-    """Génère un résumé propre et pertinent."""
-    text = (text or "").strip()
-    if not text:
-        return ""
+    # Écriture atomique : un fichier de cache n'est jamais lu à moitié écrit
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(summary, encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return summary
 
-    text = clean_extracted_text(text)
-    text = _clean_for_summary(text)
 
-    if len(text.split()) < 60:
-        return text
+def _summarize_text(text: str, max_length: int, min_length: int) -> str:
+    """Résume un texte nettoyé avec le modèle.
 
-    summarizer = _summarizer()
-    max_tokens = max(300, (summarizer.tokenizer.model_max_length or 1024) - 64)
+    Le découpage en chunks n'utilise que le tokenizer.
+    """
+    tokenizer = _tokenizer()
+    max_tokens = max(300, (tokenizer.model_max_length or 1024) - 64)
 
-    chunks = _split_into_chunks(text, summarizer.tokenizer, max_tokens=max_tokens)
+    enc = _encode_chunks(text, tokenizer, max_tokens=max_tokens)
 
-    if len(chunks) == 1:
-        summary = _summarize_chunk(chunks[0], summarizer, max_length, min_length)
+    # Les chunks restent des tokens : pas de décodage puis ré-encodage
+    if len(enc["input_ids"]) == 1:
+        summary = _generate_summaries(enc, max_length, min_length)[0]
         return summary if summary else text
 
     chunk_summaries = [
-        s for chunk in chunks
-        if (s := _summarize_chunk(chunk, summarizer, max_length=120, min_length=80))
+        s for s in _generate_summaries(enc, max_length=120, min_length=80)
+        if s
     ]
 
     if not chunk_summaries:
@@ -183,12 +428,42 @@ def summarize(text: str, max_length: int = 200, min_length: int = 150) -> str:
 
     combined = " ".join(chunk_summaries)
     if len(combined.split()) > max_length:
-        final = _summarize_chunk(combined, summarizer, max_length, min_length)
+        final = _summarize_chunk(combined, max_length, min_length)
         return final if final else combined
 
     return combined
 
 
+def summarize(
+    text: str, max_length: int = 200, min_length: int = 150, force: bool = False
+) -> str:
+    """Génère un résumé propre et pertinent.
+
+    Un texte nettoyé déjà de la longueur d'un résumé (entre `min_length` et
+    1,5 × `max_length` mots, typiquement un abstract natif) est renvoyé tel
+    quel, sauf si `force` est vrai.
+
+    Les résumés sont mis en cache sur disque (CACHE_DIR/summaries) : un texte
+    déjà résumé ne repasse pas par le modèle. Si le modèle ne se charge pas,
+    l'erreur est propagée ; s'il échoue pendant la génération,
+    SummarizationError est levée (rien n'est renvoyé ni mis en cache).
+    """
+    text = (text or "").strip()
+    # Seul test de section de références : les étapes suivantes ne le refont pas
+    if not text or _is_reference_section(text):
+        return ""
+
+    text = _clean_for_summary(_clean_text(text))
+
+    wc = len(text.split())
+    if wc < 60:
+        return text
+    if not force and min_length <= wc <= max_length * 1.5:
+        return text
+
+    return _summarize_cached(text, max_length, min_length)
+
+
 
 
 